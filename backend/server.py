@@ -1,19 +1,27 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Request, Depends, Cookie
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Depends, Cookie, Query
+from fastapi.responses import ORJSONResponse, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.encoders import jsonable_encoder
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne, DeleteOne, DeleteMany
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
 import os
+import asyncio
 import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict
+from collections import defaultdict
 import uuid
+import hashlib
+import time
 from datetime import datetime, timedelta
 import aiohttp
-import json
+import orjson
 from emergentintegrations.payments.stripe.checkout import StripeCheckout, CheckoutSessionResponse, CheckoutStatusResponse, CheckoutSessionRequest
 
 ROOT_DIR = Path(__file__).parent
@@ -21,11 +29,23 @@ load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(
+    mongo_url,
+    maxPoolSize=int(os.environ.get('MONGO_MAX_POOL_SIZE', '100')),
+    minPoolSize=int(os.environ.get('MONGO_MIN_POOL_SIZE', '10')),
+    # zstd comes from zstandard in requirements.txt; zlib is always available
+    compressors="zstd,zlib",
+    serverSelectionTimeoutMS=3000,
+    retryWrites=True,
+)
 db = client[os.environ['DB_NAME']]
 
+# Shared HTTP client for outbound calls (Emergent auth); opened on startup so
+# logins reuse keep-alive connections instead of a fresh TCP/TLS handshake each
+http_session: Optional[aiohttp.ClientSession] = None
+
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -33,27 +53,40 @@ api_router = APIRouter(prefix="/api")
 # Security
 security = HTTPBearer(auto_error=False)
 
+def new_id() -> str:
+    """Time-ordered UUID (version 7) so new documents append to the end of the id indexes"""
+    timestamp_ms = time.time_ns() // 1_000_000
+    rand = int.from_bytes(os.urandom(10), "big")
+    value = (
+        (timestamp_ms & 0xFFFFFFFFFFFF) << 80
+        | 0x7 << 76                         # version
+        | ((rand >> 62) & 0xFFF) << 64      # rand_a
+        | 0b10 << 62                        # RFC 4122 variant
+        | (rand & ((1 << 62) - 1))          # rand_b
+    )
+    return str(uuid.UUID(int=value))
+
 # Define Models
 class User(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     email: str
     name: str
     picture: Optional[str] = None
-    created_at: datetime = Field(default_factory=lambda: datetime.utcnow())
-    updated_at: datetime = Field(default_factory=lambda: datetime.utcnow())
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 class UserSession(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     user_id: str
     session_token: str
     expires_at: datetime
-    created_at: datetime = Field(default_factory=lambda: datetime.utcnow())
+    created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class AuthRequest(BaseModel):
     session_id: str
 
 class Product(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     name: str
     description: str
     price: float
@@ -76,7 +109,7 @@ class ProductCreate(BaseModel):
     unit: str
 
 class CartItem(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     product_id: str
     quantity: int
     user_id: Optional[str] = None  # For authenticated users
@@ -87,6 +120,10 @@ class CartItemCreate(BaseModel):
     quantity: int
     user_session: str
 
+class CartQuantityUpdate(BaseModel):
+    product_id: str
+    quantity: int
+
 class StateInfo(BaseModel):
     name: str
     agricultural_products: List[str]
@@ -94,7 +131,7 @@ class StateInfo(BaseModel):
     coordinates: dict  # For 3D positioning
 
 class PaymentTransaction(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     session_id: str
     amount: float
     currency: str
@@ -102,8 +139,8 @@ class PaymentTransaction(BaseModel):
     user_session: str
     user_id: Optional[str] = None
     cart_items: List[str]  # product IDs
-    created_at: datetime = Field(default_factory=lambda: datetime.utcnow())
-    updated_at: datetime = Field(default_factory=lambda: datetime.utcnow())
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
     metadata: Optional[Dict[str, str]] = None
 
 class CheckoutRequest(BaseModel):
@@ -129,36 +166,19 @@ async def get_current_user(
     if not token:
         return None
     
-    # Find session in database
-    session = await db.user_sessions.find_one({"session_token": token})
+    # Find a live session; expiry is checked by the (indexed) query itself
+    session = await db.user_sessions.find_one(
+        {"session_token": token, "expires_at": {"$gt": datetime.utcnow()}},
+        {"_id": 0, "user_id": 1}
+    )
     if not session:
         return None
     
-    # Convert expires_at to datetime for comparison
-    expires_at = session["expires_at"]
-    if isinstance(expires_at, str):
-        # Remove any timezone info and parse
-        expires_at_str = expires_at.replace('Z', '').split('.')[0]  # Remove microseconds and Z
-        try:
-            expires_at = datetime.fromisoformat(expires_at_str)
-        except ValueError:
-            # If parsing fails, treat as expired
-            return None
-    elif not isinstance(expires_at, datetime):
-        # If it's neither string nor datetime, treat as expired
-        return None
-    
-    # Now we can safely compare datetime objects
-    try:
-        if expires_at < datetime.utcnow():
-            return None
-    except TypeError:
-        # If comparison still fails, treat as expired
-        return None
-    
     # Get user data
-    user = await db.users.find_one({"id": session["user_id"]})
+    user = await db.users.find_one({"id": session["user_id"]}, {"_id": 0})
     if user:
+        # Validate rather than model_construct: users written by older versions store
+        # created_at/updated_at as ISO strings, which User parses back into datetimes
         return User(**user)
     
     return None
@@ -251,24 +271,236 @@ SAMPLE_PRODUCTS = [
     {"name": "Bajra Flour", "description": "Nutritious pearl millet flour from desert regions", "price": 40.0, "image_url": "https://images.unsplash.com/photo-1574684891174-df6b02ab38d7?w=400", "state": "rajasthan", "category": "Grains", "farmer_name": "Sunita Devi", "quantity_available": 800, "unit": "kg"}
 ]
 
+# Namespace for the stable ids given to SAMPLE_PRODUCTS when seeding
+SAMPLE_PRODUCTS_NAMESPACE = uuid.UUID("5b0f8f7e-6a43-4c1e-9d1a-3f2b8c6e7a10")
+
+# Seed documents in their final stored form. Deterministic ids let the unique
+# index dedupe concurrent seeding by several workers; SAMPLE_PRODUCTS is trusted
+# and already matches Product, so no model validation is involved.
+SAMPLE_PRODUCT_DOCS = [
+    {"id": str(uuid.uuid5(SAMPLE_PRODUCTS_NAMESPACE, product_data["name"])), **product_data}
+    for product_data in SAMPLE_PRODUCTS
+]
+
+# Pre-serialized /api/states payloads; STATES_DATA never changes at runtime
+STATES_JSON = orjson.dumps(STATES_DATA)
+STATE_JSON = {state_name: orjson.dumps(state) for state_name, state in STATES_DATA.items()}
+STATE_KEYS = frozenset(STATES_DATA)
+ROOT_JSON = orjson.dumps({"message": "AgriMap Market API"})
+
+def make_etag(body: bytes) -> str:
+    """Strong ETag derived from a serialized response body"""
+    return '"' + hashlib.md5(body, usedforsecurity=False).hexdigest() + '"'
+
+def etag_response(request: Request, body: bytes, etag: str, cache_control: Optional[str] = None) -> Response:
+    """Return the JSON body, or an empty 304 if the client already holds this version"""
+    headers = {"ETag": etag}
+    if cache_control:
+        headers["Cache-Control"] = cache_control
+    if_none_match = request.headers.get("if-none-match")
+    # If-None-Match uses the weak comparison (RFC 9110 13.1.2): proxies that re-encode
+    # the body may hand back W/"..." for our strong tag
+    if if_none_match and (
+        if_none_match.strip() == "*"
+        or etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    ):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+STATES_ETAG = make_etag(STATES_JSON)
+
+# In-process product catalog, pre-indexed by every (state, category) filter combination
+PRODUCTS_CACHE_TTL = 30  # seconds
+PRODUCTS_LIST_LIMIT = 1000
+PRODUCTS_CURSOR_BATCH_SIZE = 200
+_products_cache: Dict[tuple, List[dict]] = {}
+_products_cache_loaded_at: Optional[float] = None
+# Serialized body and ETag per (state, category), filled lazily from _products_cache
+_products_json_cache: Dict[tuple, tuple] = {}
+EMPTY_PRODUCTS_JSON = b"[]"
+EMPTY_PRODUCTS_ETAG = make_etag(EMPTY_PRODUCTS_JSON)
+
+_products_by_id: Dict[str, dict] = {}
+# Serializes reloads so an expired cache is refilled by one catalog scan, not one per request
+_products_cache_lock = asyncio.Lock()
+
+def invalidate_products_cache():
+    """Drop the cached catalog so the next listing reloads it from MongoDB"""
+    global _products_cache_loaded_at
+    _products_cache.clear()
+    _products_json_cache.clear()
+    _products_by_id.clear()
+    _products_cache_loaded_at = None
+
+def _products_cache_is_fresh() -> bool:
+    return (
+        _products_cache_loaded_at is not None
+        and time.monotonic() - _products_cache_loaded_at < PRODUCTS_CACHE_TTL
+    )
+
+async def refresh_products_cache():
+    """Reload the cached catalog from MongoDB once it is older than PRODUCTS_CACHE_TTL"""
+    global _products_cache_loaded_at
+    if _products_cache_is_fresh():
+        return
+    
+    async with _products_cache_lock:
+        # Another coroutine may have reloaded the catalog while this one waited
+        if _products_cache_is_fresh():
+            return
+        
+        # One catalog read fills every filter combination, so filtered lookups are a dict hit.
+        # Documents are indexed as cursor batches arrive rather than materialized into a list first.
+        index = defaultdict(list)
+        by_id = {}
+        async for product in db.products.find({}, {"_id": 0}).batch_size(PRODUCTS_CURSOR_BATCH_SIZE):
+            by_id[product["id"]] = product
+            for key in (
+                (None, None),
+                (product["state"], None),
+                (None, product["category"]),
+                (product["state"], product["category"]),
+            ):
+                if len(index[key]) < PRODUCTS_LIST_LIMIT:
+                    index[key].append(product)
+        _products_cache.clear()
+        _products_json_cache.clear()
+        _products_by_id.clear()
+        _products_cache.update(index)
+        _products_by_id.update(by_id)
+        _products_cache_loaded_at = time.monotonic()
+
+async def get_cached_products(state: Optional[str], category: Optional[str]) -> List[dict]:
+    """Return product documents matching the filters, served from memory while fresh"""
+    await refresh_products_cache()
+    return _products_cache.get((state, category), [])
+
+async def get_cached_product(product_id: str) -> Optional[dict]:
+    """Return a single product document, falling back to MongoDB for ids newer than the cache"""
+    await refresh_products_cache()
+    product = _products_by_id.get(product_id)
+    if product is None:
+        product = await db.products.find_one({"id": product_id}, {"_id": 0})
+    return product
+
+async def get_cached_products_json(state: Optional[str], category: Optional[str]) -> tuple:
+    """Return the serialized product listing and its ETag for the filters"""
+    products = await get_cached_products(state, category)
+    if not products:
+        return EMPTY_PRODUCTS_JSON, EMPTY_PRODUCTS_ETAG
+    
+    key = (state, category)
+    cached = _products_json_cache.get(key)
+    if cached is None:
+        body = orjson.dumps(products)
+        cached = _products_json_cache[key] = (body, make_etag(body))
+    return cached
+
+async def get_product_prices(product_ids: List[str]) -> Dict[str, float]:
+    """Map product ids to prices from the cached catalog, batch-fetching any ids it lacks"""
+    await refresh_products_cache()
+    prices = {}
+    missing = []
+    for product_id in product_ids:
+        product = _products_by_id.get(product_id)
+        if product is not None:
+            prices[product_id] = product["price"]
+        else:
+            missing.append(product_id)
+    
+    if missing:
+        async for product in db.products.find({"id": {"$in": missing}}, {"_id": 0, "id": 1, "price": 1}):
+            prices[product["id"]] = product["price"]
+    return prices
+
+async def merge_duplicate_cart_items(keys: List[str], match: Optional[dict] = None) -> int:
+    """Fold cart lines sharing `keys` into one line with the summed quantity; returns lines removed.
+    
+    Older add_to_cart versions used a racy find-then-insert and could leave duplicate lines,
+    which would stop the unique cart indexes from building.
+    """
+    pipeline = [{"$match": match}] if match else []
+    pipeline += [
+        {"$group": {
+            "_id": {key: f"${key}" for key in keys},
+            "ids": {"$push": "$_id"},
+            "quantity": {"$sum": "$quantity"},
+            "count": {"$sum": 1},
+        }},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+    operations = []
+    async for group in db.cart_items.aggregate(pipeline, allowDiskUse=True):
+        keep, *duplicates = group["ids"]
+        operations.append(UpdateOne({"_id": keep}, {"$set": {"quantity": group["quantity"]}}))
+        operations.append(DeleteMany({"_id": {"$in": duplicates}}))
+        logger.warning("Merging %d duplicate cart lines for %s", len(duplicates), group["_id"])
+    if not operations:
+        return 0
+    result = await db.cart_items.bulk_write(operations, ordered=False)
+    return result.deleted_count
+
 # Initialize database with sample data
 @app.on_event("startup")
 async def startup_event():
-    # Check if products already exist
-    existing_products = await db.products.count_documents({})
-    if existing_products == 0:
-        # Insert sample products
-        products_to_insert = []
-        for product_data in SAMPLE_PRODUCTS:
-            product = Product(**product_data)
-            products_to_insert.append(product.dict())
-        await db.products.insert_many(products_to_insert)
-        logging.info(f"Inserted {len(products_to_insert)} sample products")
+    global http_session
+    # Started per lifespan (and stopped on shutdown) so the app can be started more than once per process
+    log_listener.start()
+    
+    http_session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=100, ttl_dns_cache=300, keepalive_timeout=60)
+    )
+    
+    # Indexes for the product and cart lookups used by the API routes
+    await db.products.create_index("id", unique=True)
+    await db.products.create_index([("state", 1), ("category", 1)])
+    # The unique cart indexes back the add_to_cart upsert; merge any duplicate lines
+    # left by older versions first (only while an index is missing, since it rules
+    # duplicates out once built), and keep serving if the build still fails
+    try:
+        cart_indexes = await db.cart_items.index_information()
+        if "user_session_1_user_id_1_product_id_1" not in cart_indexes:
+            await merge_duplicate_cart_items(["user_session", "user_id", "product_id"])
+            await db.cart_items.create_index(
+                [("user_session", 1), ("user_id", 1), ("product_id", 1)], unique=True
+            )
+        if "user_id_1_product_id_1" not in cart_indexes:
+            await merge_duplicate_cart_items(["user_id", "product_id"], match={"user_id": {"$type": "string"}})
+            await db.cart_items.create_index(
+                [("user_id", 1), ("product_id", 1)],
+                unique=True,
+                partialFilterExpression={"user_id": {"$type": "string"}},
+            )
+    except OperationFailure as e:
+        logger.error("Could not build unique cart_items indexes: %s", e)
+    await db.payment_transactions.create_index("session_id", unique=True)
+    # Auth lookups by token; the TTL index lets Mongo purge expired sessions (date values only)
+    await db.user_sessions.create_index("session_token")
+    await db.user_sessions.create_index("expires_at", expireAfterSeconds=0)
+    # Sessions written through jsonable_encoder stored expires_at as an ISO string, which
+    # neither the expiry query nor the TTL index understands; convert them (idempotent)
+    converted = await db.user_sessions.update_many(
+        {"expires_at": {"$type": "string"}},
+        [{"$set": {"expires_at": {"$convert": {"input": "$expires_at", "to": "date", "onError": "$expires_at"}}}}],
+    )
+    if converted.modified_count:
+        logger.info("Converted expires_at to a date on %d sessions", converted.modified_count)
+
+    # Seed sample products once; estimated_document_count reads collection metadata
+    if await db.products.estimated_document_count() == 0:
+        try:
+            # insert_many adds _id to the dicts it is given, so hand it copies
+            await db.products.insert_many([dict(doc) for doc in SAMPLE_PRODUCT_DOCS], ordered=False)
+            logger.info("Inserted %d sample products", len(SAMPLE_PRODUCT_DOCS))
+        except BulkWriteError:
+            # Another worker seeded the same products first
+            pass
+        invalidate_products_cache()
 
 # API Routes
 @api_router.get("/")
 async def root():
-    return {"message": "AgriMap Market API"}
+    return Response(content=ROOT_JSON, media_type="application/json")
 
 # Authentication Routes
 @api_router.post("/auth/login")
@@ -276,32 +508,34 @@ async def authenticate_user(auth_request: AuthRequest, request: Request):
     """Authenticate user with Emergent session ID"""
     try:
         # Call Emergent auth API
-        async with aiohttp.ClientSession() as session:
-            headers = {"X-Session-ID": auth_request.session_id}
-            async with session.get(
-                "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
-                headers=headers
-            ) as response:
-                if response.status != 200:
-                    raise HTTPException(status_code=401, detail="Invalid session")
-                
-                auth_data = await response.json()
+        headers = {"X-Session-ID": auth_request.session_id}
+        async with http_session.get(
+            "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
+            headers=headers
+        ) as response:
+            if response.status != 200:
+                raise HTTPException(status_code=401, detail="Invalid session")
+            
+            auth_data = await response.json()
         
         # Check if user exists
-        existing_user = await db.users.find_one({"email": auth_data["email"]})
+        existing_user = await db.users.find_one({"email": auth_data["email"]}, {"_id": 0})
+        
+        # One timestamp for every row this login writes
+        now = datetime.utcnow()
         
         if not existing_user:
             # Create new user
             user_data = {
-                "id": str(uuid.uuid4()),
+                "id": new_id(),
                 "email": auth_data["email"],
                 "name": auth_data["name"],
                 "picture": auth_data.get("picture"),
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
+                "created_at": now,
+                "updated_at": now
             }
+            # Data from the auth provider is untrusted and still goes through validation
             user = User(**user_data)
-            await db.users.insert_one(jsonable_encoder(user))
             user_id = user.id
         else:
             user_id = existing_user["id"]
@@ -309,24 +543,29 @@ async def authenticate_user(auth_request: AuthRequest, request: Request):
         
         # Create session
         session_token = auth_data["session_token"]
-        expires_at = datetime.utcnow() + timedelta(days=7)
+        expires_at = now + timedelta(days=7)
         
         user_session_data = {
-            "id": str(uuid.uuid4()),
+            "id": new_id(),
             "user_id": user_id,
             "session_token": session_token,
             "expires_at": expires_at,
-            "created_at": datetime.utcnow()
+            "created_at": now
         }
         
         user_session = UserSession(**user_session_data)
-        await db.user_sessions.insert_one(jsonable_encoder(user_session))
+        session_insert = db.user_sessions.insert_one(user_session.model_dump())
+        if existing_user:
+            await session_insert
+        else:
+            # The session row only references the new user's id, so both inserts can run together
+            await asyncio.gather(db.users.insert_one(user.model_dump()), session_insert)
         
         # Create response with HttpOnly cookie
-        response = JSONResponse(jsonable_encoder({
-            "user": user.dict(),
+        response = ORJSONResponse({
+            "user": user.model_dump(),
             "message": "Authentication successful"
-        }))
+        })
         
         response.set_cookie(
             key="session_token",
@@ -344,7 +583,7 @@ async def authenticate_user(auth_request: AuthRequest, request: Request):
         # Re-raise HTTPExceptions (like 401) as-is
         raise
     except Exception as e:
-        logging.error(f"Authentication error: {str(e)}")
+        logger.exception("Authentication error: %s", e)
         raise HTTPException(status_code=500, detail="Authentication failed")
 
 @api_router.post("/auth/logout")
@@ -355,7 +594,7 @@ async def logout_user(request: Request, current_user: Optional[User] = Depends(g
         if session_token:
             await db.user_sessions.delete_one({"session_token": session_token})
     
-    response = JSONResponse({"message": "Logged out successfully"})
+    response = ORJSONResponse({"message": "Logged out successfully"})
     response.delete_cookie("session_token", path="/")
     return response
 
@@ -366,94 +605,126 @@ async def get_current_user_info(current_user: Optional[User] = Depends(get_curre
         raise HTTPException(status_code=401, detail="Not authenticated")
     return current_user
 
-@api_router.get("/states", response_model=dict)
-async def get_states():
-    return STATES_DATA
+@api_router.get("/states")
+async def get_states(request: Request):
+    return etag_response(request, STATES_JSON, STATES_ETAG, cache_control="public, max-age=300")
 
-@api_router.get("/states/{state_name}", response_model=dict)
+@api_router.get("/states/{state_name}")
 async def get_state_info(state_name: str):
-    if state_name.lower() in STATES_DATA:
-        return STATES_DATA[state_name.lower()]
+    state_json = STATE_JSON.get(state_name.lower())
+    if state_json is not None:
+        return Response(content=state_json, media_type="application/json")
     raise HTTPException(status_code=404, detail="State not found")
 
-@api_router.get("/products", response_model=List[Product])
-async def get_products(state: Optional[str] = None, category: Optional[str] = None):
-    query = {}
+@api_router.get("/products")
+async def get_products(
+    request: Request,
+    state: Optional[str] = None,
+    category: Optional[str] = None,
+    skip: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=PRODUCTS_LIST_LIMIT),
+):
     if state:
-        query["state"] = state.lower()
-    if category:
-        query["category"] = category
-    
-    products = await db.products.find(query).to_list(1000)
-    return [Product(**product) for product in products]
+        state = state.lower()
+        if state not in STATE_KEYS:
+            # No product can match an unknown state; skip the cache refresh and serve the shared empty listing
+            return etag_response(request, EMPTY_PRODUCTS_JSON, EMPTY_PRODUCTS_ETAG)
+    # An empty ?category= means no filter, like an omitted one
+    category = category or None
+    if skip or limit is not None:
+        # Pages are sliced from the cached listing; only the full listing's bytes are memoized
+        products = await get_cached_products(state or None, category)
+        page = products[skip:skip + limit if limit is not None else None]
+        body = orjson.dumps(page)
+        return etag_response(request, body, make_etag(body))
+    # Documents were written through Product, so serve them as-is without re-validating
+    body, etag = await get_cached_products_json(state or None, category)
+    return etag_response(request, body, etag)
 
 @api_router.get("/products/{product_id}", response_model=Product)
 async def get_product(product_id: str):
-    product = await db.products.find_one({"id": product_id})
+    product = await get_cached_product(product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    return Product(**product)
+    # Returning a response directly keeps response_model for the docs but skips re-validation
+    return ORJSONResponse(product)
 
 @api_router.post("/cart/add", response_model=CartItem)
 async def add_to_cart(cart_item: CartItemCreate, current_user: Optional[User] = Depends(get_current_user)):
-    # Verify product exists
-    product = await db.products.find_one({"id": cart_item.product_id})
-    if not product:
+    # Verify product exists (catalog cache, falling back to MongoDB for newer ids)
+    if not await get_cached_product(cart_item.product_id):
         raise HTTPException(status_code=404, detail="Product not found")
     
     # Set user_id if authenticated
     user_id = current_user.id if current_user else None
     
-    # Check if item already exists in cart
+    # Match the existing cart line for this user (authenticated or guest)
     query = {"product_id": cart_item.product_id}
     if user_id:
         query["user_id"] = user_id
     else:
         query["user_session"] = cart_item.user_session
         query["user_id"] = None
-    
-    existing_item = await db.cart_items.find_one(query)
-    
-    if existing_item:
-        # Update quantity
-        new_quantity = existing_item["quantity"] + cart_item.quantity
-        await db.cart_items.update_one(
-            {"id": existing_item["id"]},
-            {"$set": {"quantity": new_quantity}}
-        )
-        existing_item["quantity"] = new_quantity
-        return CartItem(**existing_item)
-    else:
-        # Create new cart item
-        cart_item_dict = cart_item.dict()
-        cart_item_dict["user_id"] = user_id
-        cart_item_obj = CartItem(**cart_item_dict)
-        await db.cart_items.insert_one(cart_item_obj.dict())
-        return cart_item_obj
+
+    # Increment the quantity or create the line in one atomic round-trip
+    upsert_args = dict(
+        filter=query,
+        update={
+            "$inc": {"quantity": cart_item.quantity},
+            "$setOnInsert": {
+                "id": new_id(),
+                "user_session": cart_item.user_session,
+            },
+        },
+        projection={"_id": 0},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    try:
+        item = await db.cart_items.find_one_and_update(**upsert_args)
+    except DuplicateKeyError:
+        # A concurrent add inserted this line first; retrying now just increments it
+        item = await db.cart_items.find_one_and_update(**upsert_args)
+    return ORJSONResponse(item)
 
 @api_router.get("/cart/{user_session}", response_model=List[dict])
 async def get_cart(user_session: str, current_user: Optional[User] = Depends(get_current_user)):
     # Get cart items for user (authenticated or guest)
     if current_user:
-        cart_items = await db.cart_items.find({"user_id": current_user.id}).to_list(1000)
+        match = {"user_id": current_user.id}
     else:
-        cart_items = await db.cart_items.find({
-            "user_session": user_session,
-            "user_id": None
-        }).to_list(1000)
+        match = {"user_session": user_session, "user_id": None}
     
-    # Enrich cart items with product details
-    enriched_items = []
-    for item in cart_items:
-        product = await db.products.find_one({"id": item["product_id"]})
-        if product:
-            enriched_items.append({
-                "cart_item": CartItem(**item),
-                "product": Product(**product),
-                "total_price": product["price"] * item["quantity"]
-            })
+    # Join product details server-side; lines whose product is gone are dropped by $unwind
+    pipeline = [
+        {"$match": match},
+        {"$lookup": {"from": "products", "localField": "product_id", "foreignField": "id", "as": "product"}},
+        {"$unwind": "$product"},
+        {"$project": {"_id": 0, "product._id": 0}},
+        {"$project": {
+            "cart_item": {
+                "id": "$id",
+                "product_id": "$product_id",
+                "quantity": "$quantity",
+                "user_id": "$user_id",
+                "user_session": "$user_session",
+            },
+            "product": "$product",
+            "total_price": {"$multiply": ["$product.price", "$quantity"]},
+        }},
+    ]
+    enriched_items = await db.cart_items.aggregate(pipeline, batchSize=64).to_list(None)
+    return ORJSONResponse(enriched_items)
+
+@api_router.delete("/cart/{user_session}")
+async def clear_cart(user_session: str, current_user: Optional[User] = Depends(get_current_user)):
+    if current_user:
+        query = {"user_id": current_user.id}
+    else:
+        query = {"user_session": user_session, "user_id": None}
     
-    return enriched_items
+    result = await db.cart_items.delete_many(query)
+    return {"message": "Cart cleared", "deleted": result.deleted_count}
 
 @api_router.delete("/cart/{user_session}/{product_id}")
 async def remove_from_cart(user_session: str, product_id: str, current_user: Optional[User] = Depends(get_current_user)):
@@ -490,45 +761,85 @@ async def update_cart_quantity(user_session: str, product_id: str, quantity: int
         raise HTTPException(status_code=404, detail="Cart item not found")
     return {"message": "Cart updated"}
 
+@api_router.put("/cart/{user_session}")
+async def update_cart_quantities(user_session: str, updates: List[CartQuantityUpdate], current_user: Optional[User] = Depends(get_current_user)):
+    """Apply several quantity changes in one bulk write; quantities <= 0 remove the item"""
+    if current_user:
+        owner = {"user_id": current_user.id}
+    else:
+        owner = {"user_session": user_session, "user_id": None}
+    
+    operations = [
+        UpdateOne({**owner, "product_id": update.product_id}, {"$set": {"quantity": update.quantity}})
+        if update.quantity > 0
+        else DeleteOne({**owner, "product_id": update.product_id})
+        for update in updates
+    ]
+    if not operations:
+        return {"message": "Cart updated", "matched": 0, "deleted": 0}
+    
+    result = await db.cart_items.bulk_write(operations, ordered=False)
+    return {"message": "Cart updated", "matched": result.matched_count, "deleted": result.deleted_count}
+
 # Stripe Payment Integration
+STRIPE_API_KEY = os.environ.get('STRIPE_API_KEY')
+# Approximate INR -> USD rate for Stripe amounts; override without a code change via INR_PER_USD
+INR_PER_USD = float(os.environ.get('INR_PER_USD', '82.0'))
+# Webhook URL computed once from configuration; without PUBLIC_BASE_URL the
+# handlers fall back to deriving it from the incoming request
+PUBLIC_BASE_URL = os.environ.get('PUBLIC_BASE_URL', '').rstrip('/')
+STRIPE_WEBHOOK_URL = f"{PUBLIC_BASE_URL}/api/webhook/stripe" if PUBLIC_BASE_URL else None
+BACKEND_WEBHOOK_URL = f"{os.environ.get('REACT_APP_BACKEND_URL', 'http://localhost:8001')}/api/webhook/stripe"
+
+# One StripeCheckout client per webhook URL, reused across requests
+STRIPE_CHECKOUTS_MAX_ENTRIES = 16
+_stripe_checkouts: Dict[str, StripeCheckout] = {}
+
+def get_stripe_checkout(webhook_url: str) -> StripeCheckout:
+    """Return the shared StripeCheckout client for the given webhook URL"""
+    stripe_checkout = _stripe_checkouts.get(webhook_url)
+    if stripe_checkout is None:
+        stripe_checkout = StripeCheckout(api_key=STRIPE_API_KEY, webhook_url=webhook_url)
+        if len(_stripe_checkouts) >= STRIPE_CHECKOUTS_MAX_ENTRIES:
+            # URLs derive from the request Host header, so keep the memo bounded
+            _stripe_checkouts.clear()
+        _stripe_checkouts[webhook_url] = stripe_checkout
+    return stripe_checkout
+
 @api_router.post("/checkout/create-session")
 async def create_checkout_session(request: Request, checkout_req: CheckoutRequest, current_user: Optional[User] = Depends(get_current_user)):
     try:
-        # Get cart items based on authentication status
+        # Get cart items based on authentication status; pricing only needs the id and quantity
+        cart_projection = {"_id": 0, "product_id": 1, "quantity": 1}
         if current_user:
-            cart_items = await db.cart_items.find({"user_id": current_user.id}).to_list(1000)
+            cart_items = await db.cart_items.find({"user_id": current_user.id}, cart_projection).to_list(1000)
         else:
             cart_items = await db.cart_items.find({
                 "user_session": checkout_req.user_session,
                 "user_id": None
-            }).to_list(1000)
+            }, cart_projection).to_list(1000)
         
         if not cart_items:
             raise HTTPException(status_code=400, detail="Cart is empty")
         
         # Calculate total amount
-        total_amount = 0.0
-        product_ids = []
-        for item in cart_items:
-            product = await db.products.find_one({"id": item["product_id"]})
-            if product:
-                total_amount += product["price"] * item["quantity"]
-                product_ids.append(item["product_id"])
+        prices = await get_product_prices([item["product_id"] for item in cart_items])
+        priced_items = [item for item in cart_items if item["product_id"] in prices]
+        total_amount = sum((prices[item["product_id"]] * item["quantity"] for item in priced_items), 0.0)
+        product_ids = [item["product_id"] for item in priced_items]
         
         if total_amount <= 0:
             raise HTTPException(status_code=400, detail="Invalid cart total")
         
         # Convert INR to USD for Stripe (approximate conversion rate)
-        usd_amount = round(total_amount / 82.0, 2)  # Assuming 1 USD = 82 INR
+        usd_amount = round(total_amount / INR_PER_USD, 2)
         
         # Initialize Stripe checkout
-        stripe_api_key = os.environ.get('STRIPE_API_KEY')
-        if not stripe_api_key:
+        if not STRIPE_API_KEY:
             raise HTTPException(status_code=500, detail="Stripe API key not configured")
         
-        host_url = str(request.base_url).rstrip('/')
-        webhook_url = f"{host_url}/api/webhook/stripe"
-        stripe_checkout = StripeCheckout(api_key=stripe_api_key, webhook_url=webhook_url)
+        webhook_url = STRIPE_WEBHOOK_URL or f"{str(request.base_url).rstrip('/')}/api/webhook/stripe"
+        stripe_checkout = get_stripe_checkout(webhook_url)
         
         # Create success and cancel URLs
         success_url = f"{checkout_req.origin_url}/success?session_id={{CHECKOUT_SESSION_ID}}"
@@ -566,8 +877,9 @@ async def create_checkout_session(request: Request, checkout_req: CheckoutReques
             "user_email": current_user.email if current_user else "guest"
         }
         
+        now = datetime.utcnow()
         payment_transaction_data = {
-            "id": str(uuid.uuid4()),
+            "id": new_id(),
             "session_id": session.session_id,
             "amount": total_amount,
             "currency": "INR",
@@ -575,13 +887,13 @@ async def create_checkout_session(request: Request, checkout_req: CheckoutReques
             "user_session": checkout_req.user_session,
             "user_id": current_user.id if current_user else None,
             "cart_items": product_ids,
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow(),
+            "created_at": now,
+            "updated_at": now,
             "metadata": transaction_metadata
         }
         
         payment_transaction = PaymentTransaction(**payment_transaction_data)
-        await db.payment_transactions.insert_one(jsonable_encoder(payment_transaction))
+        await db.payment_transactions.insert_one(payment_transaction.model_dump())
         
         return {"url": session.url, "session_id": session.session_id}
         
@@ -589,21 +901,24 @@ async def create_checkout_session(request: Request, checkout_req: CheckoutReques
         # Re-raise HTTPExceptions (like 400) as-is
         raise
     except Exception as e:
-        logging.error(f"Error creating checkout session: {str(e)}")
+        logger.exception("Error creating checkout session: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/checkout/status/{session_id}")
 async def get_checkout_status(session_id: str):
     try:
-        # Get payment transaction from database
-        transaction = await db.payment_transactions.find_one({"session_id": session_id})
+        # Get payment transaction from database first: the route is public, so only
+        # sessions we created may cost an outbound Stripe request
+        transaction = await db.payment_transactions.find_one(
+            {"session_id": session_id},
+            {"_id": 0, "payment_status": 1, "user_id": 1, "user_session": 1, "amount": 1}
+        )
         if not transaction:
             raise HTTPException(status_code=404, detail="Payment transaction not found")
         
         # Check with Stripe
-        stripe_api_key = os.environ.get('STRIPE_API_KEY')
-        webhook_url = f"{os.environ.get('REACT_APP_BACKEND_URL', 'http://localhost:8001')}/api/webhook/stripe"
-        stripe_checkout = StripeCheckout(api_key=stripe_api_key, webhook_url=webhook_url)
+        webhook_url = STRIPE_WEBHOOK_URL or BACKEND_WEBHOOK_URL
+        stripe_checkout = get_stripe_checkout(webhook_url)
         
         checkout_status = await stripe_checkout.get_checkout_status(session_id)
         
@@ -612,10 +927,9 @@ async def get_checkout_status(session_id: str):
             await db.payment_transactions.update_one(
                 {"session_id": session_id},
                 {
-                    "$set": {
-                        "payment_status": checkout_status.payment_status,
-                        "updated_at": datetime.utcnow()
-                    }
+                    "$set": {"payment_status": checkout_status.payment_status},
+                    # Let the server stamp the time instead of encoding a client-side datetime
+                    "$currentDate": {"updated_at": {"$type": "date"}}
                 }
             )
             
@@ -638,18 +952,21 @@ async def get_checkout_status(session_id: str):
         # Re-raise HTTPExceptions as-is
         raise
     except Exception as e:
-        logging.error(f"Error checking payment status: {str(e)}")
+        logger.exception("Error checking payment status: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.post("/webhook/stripe")
 async def stripe_webhook(request: Request):
+    signature = request.headers.get("Stripe-Signature")
+    if not signature:
+        # Unsigned payloads can never verify; reject them before reading or parsing the body
+        return ORJSONResponse(status_code=400, content={"error": "Missing Stripe-Signature header"})
+    
     try:
         body = await request.body()
-        signature = request.headers.get("Stripe-Signature")
         
-        stripe_api_key = os.environ.get('STRIPE_API_KEY')
-        webhook_url = f"{str(request.base_url)}/api/webhook/stripe"
-        stripe_checkout = StripeCheckout(api_key=stripe_api_key, webhook_url=webhook_url)
+        webhook_url = STRIPE_WEBHOOK_URL or f"{str(request.base_url)}/api/webhook/stripe"
+        stripe_checkout = get_stripe_checkout(webhook_url)
         
         webhook_response = await stripe_checkout.handle_webhook(body, signature)
         
@@ -658,18 +975,16 @@ async def stripe_webhook(request: Request):
             await db.payment_transactions.update_one(
                 {"session_id": webhook_response.session_id},
                 {
-                    "$set": {
-                        "payment_status": webhook_response.payment_status,
-                        "updated_at": datetime.utcnow()
-                    }
+                    "$set": {"payment_status": webhook_response.payment_status},
+                    "$currentDate": {"updated_at": {"$type": "date"}}
                 }
             )
         
         return {"status": "success"}
         
     except Exception as e:
-        logging.error(f"Webhook error: {str(e)}")
-        return JSONResponse(status_code=400, content={"error": str(e)})
+        logger.error("Webhook error: %s", e)
+        return ORJSONResponse(status_code=400, content={"error": str(e)})
 
 # Include the router in the main app
 app.include_router(api_router)
@@ -682,13 +997,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Configure logging
+# Compress larger JSON payloads such as the product listing
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+# Configure logging; records are handed to a queue and written to stderr by a
+# listener thread, so handlers never block the event loop. The listener's handler
+# applies the real format; the QueueHandler only merges args (and any traceback)
+# into the message, so the prefix isn't rendered twice.
+log_queue = queue.SimpleQueue()
+log_handler = logging.StreamHandler()
+log_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+log_listener = QueueListener(log_queue, log_handler)
+queue_handler = QueueHandler(log_queue)
+queue_handler.setFormatter(logging.Formatter('%(message)s'))
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    handlers=[queue_handler]
 )
 logger = logging.getLogger(__name__)
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    client.close()
+    if http_session is not None:
+        await http_session.close()
+    log_listener.stop()
\ No newline at end of file
@@ -1,249 +1,340 @@
-import requests
+import aiohttp
+import asyncio
 import sys
-import json
-from datetime import datetime
+import orjson
+import os
+import logging
+
+log = logging.getLogger("backend_test")
+
+STATES = ('punjab', 'maharashtra', 'kerala', 'tamil_nadu', 'karnataka', 'west_bengal', 'gujarat', 'rajasthan')
+EXPECTED_STATES = frozenset(STATES)
+REQUIRED_STATE_FIELDS = frozenset({'name', 'agricultural_products', 'description', 'coordinates'})
+
+# Statuses worth retrying for idempotent requests (gateway hiccups on the preview host)
+RETRY_STATUSES = frozenset({502, 503, 504})
+RETRY_METHODS = frozenset({'GET', 'PUT', 'DELETE'})
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.2  # seconds, doubled per attempt
 
 class AgriMapAPITester:
     def __init__(self, base_url="https://mapfresh-market.preview.emergentagent.com"):
         self.base_url = base_url
         self.api_url = f"{base_url}/api"
-        self.session_id = f"test_session_{datetime.now().strftime('%H%M%S')}"
+        # Random rather than clock-based, so runs started in the same second don't share a cart
+        self.session_id = f"test_session_{os.urandom(4).hex()}"
         self.tests_run = 0
         self.tests_passed = 0
-        self.product_ids = []
+        self.product_id = None
+        self.session = None
+
+    async def __aenter__(self):
+        # One keep-alive connection pool shared by all (concurrent) requests in the run.
+        # aiohttp already sets TCP_NODELAY on its sockets; keep the host's DNS answer
+        # for the whole run so connections opened mid-run skip the lookup.
+        self.session = aiohttp.ClientSession(
+            headers={'Content-Type': 'application/json'},
+            connector=aiohttp.TCPConnector(limit=20, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=10, connect=3.05),
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
 
-    def run_test(self, name, method, endpoint, expected_status, data=None, params=None):
+    async def _request(self, method, url, data=None, params=None, headers=None):
+        """Send a request, retrying idempotent methods on gateway errors; returns (status, headers, body)"""
+        payload = None if data is None else orjson.dumps(data)
+        attempt = 0
+        while True:
+            async with self.session.request(method, url, data=payload, params=params, headers=headers) as response:
+                status_code = response.status
+                response_headers = response.headers
+                body = await response.read()
+            if status_code not in RETRY_STATUSES or method not in RETRY_METHODS or attempt >= MAX_RETRIES:
+                return status_code, response_headers, body
+            await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+            attempt += 1
+
+    async def run_test(self, name, method, endpoint, expected_status, data=None, params=None):
         """Run a single API test"""
         url = f"{self.api_url}/{endpoint}" if endpoint else self.api_url
-        headers = {'Content-Type': 'application/json'}
 
         self.tests_run += 1
-        print(f"\n🔍 Testing {name}...")
-        print(f"   URL: {url}")
+        # Collect this test's report and emit it as one record so concurrent tests don't interleave
+        lines = [f"\n🔍 Testing {name}...", f"   URL: {url}"]
+        success = False
         
         try:
-            if method == 'GET':
-                response = requests.get(url, headers=headers, params=params)
-            elif method == 'POST':
-                response = requests.post(url, json=data, headers=headers)
-            elif method == 'PUT':
-                response = requests.put(url, json=data, headers=headers, params=params)
-            elif method == 'DELETE':
-                response = requests.delete(url, headers=headers)
-
-            success = response.status_code == expected_status
+            status_code, response_headers, body = await self._request(method, url, data=data, params=params)
+            content_type = response_headers.get('Content-Type', '')
+
+            success = status_code == expected_status
             if success:
                 self.tests_passed += 1
-                print(f"✅ Passed - Status: {response.status_code}")
+                lines.append(f"✅ Passed - Status: {status_code}")
+                if expected_status // 100 != 2 or not body:
+                    # Status-only checks (expected errors, empty bodies) have nothing to decode
+                    return True, {}
                 try:
-                    response_data = response.json()
+                    response_data = orjson.loads(body)
                     if isinstance(response_data, list) and len(response_data) > 0:
-                        print(f"   Response: {len(response_data)} items returned")
+                        lines.append(f"   Response: {len(response_data)} items returned")
                     elif isinstance(response_data, dict):
-                        print(f"   Response keys: {list(response_data.keys())}")
+                        lines.append(f"   Response keys: {list(response_data.keys())}")
                     return True, response_data
                 except:
                     return True, {}
             else:
-                print(f"❌ Failed - Expected {expected_status}, got {response.status_code}")
-                try:
-                    error_detail = response.json()
-                    print(f"   Error: {error_detail}")
-                except:
-                    print(f"   Error: {response.text}")
+                lines.append(f"❌ Failed - Expected {expected_status}, got {status_code}")
+                # Only JSON error bodies are worth parsing; HTML/empty 404s are shown as text
+                error_detail = orjson.loads(body) if 'json' in content_type and body else body.decode(errors='replace')
+                lines.append(f"   Error: {error_detail}")
                 return False, {}
 
         except Exception as e:
-            print(f"❌ Failed - Error: {str(e)}")
+            lines.append(f"❌ Failed - Error: {str(e)}")
             return False, {}
+        finally:
+            log.log(logging.INFO if success else logging.WARNING, "\n".join(lines))
 
-    def test_root_endpoint(self):
+    async def test_root_endpoint(self):
         """Test root API endpoint"""
-        return self.run_test("Root API Endpoint", "GET", "", 200)
+        return await self.run_test("Root API Endpoint", "GET", "", 200)
 
-    def test_get_states(self):
+    async def test_get_states(self):
         """Test getting all states"""
-        success, response = self.run_test("Get All States", "GET", "states", 200)
+        success, response = await self.run_test("Get All States", "GET", "states", 200)
         if success and response:
-            expected_states = ['punjab', 'maharashtra', 'kerala', 'tamil_nadu', 'karnataka', 'west_bengal', 'gujarat', 'rajasthan']
             actual_states = list(response.keys())
-            if all(state in actual_states for state in expected_states):
-                print(f"   ✅ All 8 expected states found: {actual_states}")
+            if EXPECTED_STATES.issubset(response):
+                log.info(f"   ✅ All {len(STATES)} expected states found: {actual_states}")
             else:
-                print(f"   ⚠️  Expected states: {expected_states}")
-                print(f"   ⚠️  Actual states: {actual_states}")
+                log.warning(f"   ⚠️  Expected states: {list(STATES)}")
+                log.warning(f"   ⚠️  Actual states: {actual_states}")
         return success, response
 
-    def test_get_specific_state(self, state_name="punjab"):
+    async def test_states_etag(self):
+        """Test that /states answers a matching If-None-Match with an empty 304"""
+        url = f"{self.api_url}/states"
+        self.tests_run += 1
+        lines = ["\n🔍 Testing States ETag Revalidation...", f"   URL: {url}"]
+        success = False
+        try:
+            status_code, response_headers, _ = await self._request("GET", url)
+            etag = response_headers.get('ETag')
+            if status_code != 200 or not etag:
+                lines.append(f"❌ Failed - Expected 200 with an ETag, got {status_code} (ETag: {etag})")
+                return False
+            
+            status_code, _, body = await self._request("GET", url, headers={'If-None-Match': etag})
+            success = status_code == 304 and not body
+            if success:
+                self.tests_passed += 1
+                lines.append(f"✅ Passed - Status: {status_code} with an empty body")
+            else:
+                lines.append(f"❌ Failed - Expected an empty 304, got {status_code} ({len(body)} bytes)")
+            return success
+        except Exception as e:
+            lines.append(f"❌ Failed - Error: {str(e)}")
+            return False
+        finally:
+            log.log(logging.INFO if success else logging.WARNING, "\n".join(lines))
+
+    async def test_get_specific_state(self, state_name="punjab"):
         """Test getting specific state info"""
-        success, response = self.run_test(f"Get {state_name.title()} State Info", "GET", f"states/{state_name}", 200)
+        success, response = await self.run_test(f"Get {state_name.title()} State Info", "GET", f"states/{state_name}", 200)
         if success and response:
-            required_fields = ['name', 'agricultural_products', 'description', 'coordinates']
-            if all(field in response for field in required_fields):
-                print(f"   ✅ All required fields present: {required_fields}")
+            if REQUIRED_STATE_FIELDS.issubset(response):
+                log.info(f"   ✅ All required fields present: {sorted(REQUIRED_STATE_FIELDS)}")
             else:
-                print(f"   ⚠️  Missing fields in response")
+                log.warning(f"   ⚠️  Missing fields in response: {sorted(REQUIRED_STATE_FIELDS - response.keys())}")
         return success, response
 
-    def test_get_all_products(self):
+    async def test_get_all_products(self):
         """Test getting all products"""
-        success, response = self.run_test("Get All Products", "GET", "products", 200)
+        success, response = await self.run_test("Get All Products", "GET", "products", 200)
         if success and response:
-            self.product_ids = [product['id'] for product in response if 'id' in product]
-            print(f"   ✅ Found {len(response)} products, collected {len(self.product_ids)} product IDs")
+            # Only the first product is ever used by the later tests
+            self.product_id = next((product['id'] for product in response if 'id' in product), None)
+            log.info(f"   ✅ Found {len(response)} products, using product ID {self.product_id}")
         return success, response
 
-    def test_get_products_by_state(self, state="punjab"):
+    async def test_get_products_by_state(self, state="punjab"):
         """Test getting products filtered by state"""
-        success, response = self.run_test(f"Get {state.title()} Products", "GET", "products", 200, params={"state": state})
+        success, response = await self.run_test(f"Get {state.title()} Products", "GET", "products", 200, params={"state": state})
         if success and response:
             # Verify all products belong to the requested state
             state_products = [p for p in response if p.get('state') == state]
             if len(state_products) == len(response):
-                print(f"   ✅ All {len(response)} products belong to {state}")
+                log.info(f"   ✅ All {len(response)} products belong to {state}")
             else:
-                print(f"   ⚠️  Some products don't belong to {state}")
+                log.warning(f"   ⚠️  Some products don't belong to {state}")
         return success, response
 
-    def test_get_specific_product(self):
+    async def test_all_states_products(self):
+        """Test the product listing of every state; the per-state requests run concurrently"""
+        results = await asyncio.gather(*[self.test_get_products_by_state(state) for state in STATES])
+        return all(success for success, _ in results)
+
+    async def test_products_pagination(self):
+        """Test skip/limit pagination of the product listing against the full listing"""
+        (success_full, full), (success_page, page), (success_invalid, _) = await asyncio.gather(
+            self.run_test("Get Punjab Products (unpaginated)", "GET", "products", 200, params={"state": "punjab"}),
+            self.run_test("Get Punjab Products Page", "GET", "products", 200, params={"state": "punjab", "skip": 1, "limit": 1}),
+            self.run_test("Products Page - limit=0", "GET", "products", 422, params={"limit": 0}),
+        )
+        if not (success_full and success_page):
+            return False
+        if len(full) < 2:
+            log.warning(f"   ⚠️  Need at least 2 Punjab products to check pagination, got {len(full)}")
+            return False
+        if page == full[1:2]:
+            log.info("   ✅ skip=1&limit=1 returned the second product of the full listing")
+        else:
+            log.warning(f"   ⚠️  Expected {[p.get('id') for p in full[1:2]]}, got {[p.get('id') for p in page]}")
+            return False
+        return success_invalid
+
+    async def test_get_specific_product(self):
         """Test getting a specific product by ID"""
-        if not self.product_ids:
-            print("❌ No product IDs available for testing")
+        if not self.product_id:
+            log.warning("❌ No product ID available for testing")
             return False, {}
         
-        product_id = self.product_ids[0]
-        return self.run_test("Get Specific Product", "GET", f"products/{product_id}", 200)
+        product_id = self.product_id
+        return await self.run_test("Get Specific Product", "GET", f"products/{product_id}", 200)
 
-    def test_add_to_cart(self):
-        """Test adding product to cart"""
-        if not self.product_ids:
-            print("❌ No product IDs available for cart testing")
-            return False, {}
+    async def test_cart_lifecycle(self):
+        """Test add -> get -> update -> remove on one cart item over the warm session"""
+        if not self.product_id:
+            log.warning("❌ No product ID available for cart testing")
+            return False
         
-        product_id = self.product_ids[0]
+        product_id = self.product_id
         cart_data = {
             "product_id": product_id,
             "quantity": 2,
             "user_session": self.session_id
         }
-        return self.run_test("Add Product to Cart", "POST", "cart/add", 200, data=cart_data)
-
-    def test_get_cart(self):
-        """Test getting cart contents"""
-        return self.run_test("Get Cart Contents", "GET", f"cart/{self.session_id}", 200)
-
-    def test_update_cart_quantity(self):
-        """Test updating cart item quantity"""
-        if not self.product_ids:
-            print("❌ No product IDs available for cart update testing")
-            return False, {}
-        
-        product_id = self.product_ids[0]
-        return self.run_test("Update Cart Quantity", "PUT", f"cart/{self.session_id}/{product_id}", 200, params={"quantity": 3})
-
-    def test_remove_from_cart(self):
-        """Test removing item from cart"""
-        if not self.product_ids:
-            print("❌ No product IDs available for cart removal testing")
-            return False, {}
+        success_add, _ = await self.run_test("Add Product to Cart", "POST", "cart/add", 200, data=cart_data)
+        success_get, _ = await self.run_test("Get Cart Contents", "GET", f"cart/{self.session_id}", 200)
+        success_update, _ = await self.run_test("Update Cart Quantity", "PUT", f"cart/{self.session_id}/{product_id}", 200, params={"quantity": 3})
+        success_remove, _ = await self.run_test("Remove from Cart", "DELETE", f"cart/{self.session_id}/{product_id}", 200)
         
-        product_id = self.product_ids[0]
-        return self.run_test("Remove from Cart", "DELETE", f"cart/{self.session_id}/{product_id}", 200)
+        return success_add and success_get and success_update and success_remove
 
-    def test_checkout_create_session(self):
+    async def test_checkout_create_session(self):
         """Test creating checkout session (Stripe integration)"""
         # First add a product to cart
-        if not self.product_ids:
-            print("❌ No product IDs available for checkout testing")
+        if not self.product_id:
+            log.warning("❌ No product ID available for checkout testing")
             return False, {}
         
-        # Add product to cart first
-        product_id = self.product_ids[0]
+        # Add product to cart first. This is setup, not a check of its own, so it is
+        # sent directly; it must still complete before checkout reads the cart
+        product_id = self.product_id
         cart_data = {
             "product_id": product_id,
             "quantity": 1,
             "user_session": self.session_id
         }
-        self.run_test("Add Product for Checkout", "POST", "cart/add", 200, data=cart_data)
+        status_code, _, _ = await self._request("POST", f"{self.api_url}/cart/add", data=cart_data)
+        if status_code != 200:
+            log.warning(f"   ⚠️  Adding product for checkout returned {status_code}")
         
         # Now test checkout session creation
         checkout_data = {
             "origin_url": "https://mapfresh-market.preview.emergentagent.com",
             "user_session": self.session_id
         }
-        success, response = self.run_test("Create Checkout Session", "POST", "checkout/create-session", 200, data=checkout_data)
+        success, response = await self.run_test("Create Checkout Session", "POST", "checkout/create-session", 200, data=checkout_data)
         
         if success and response:
             if 'url' in response and 'session_id' in response:
-                print(f"   ✅ Checkout session created with URL and session_id")
+                log.info(f"   ✅ Checkout session created with URL and session_id")
                 return success, response
             else:
-                print(f"   ⚠️  Missing 'url' or 'session_id' in response")
+                log.warning(f"   ⚠️  Missing 'url' or 'session_id' in response")
         
         return success, response
 
-    def test_checkout_status_invalid(self):
+    async def test_checkout_status_invalid(self):
         """Test checkout status with invalid session ID"""
-        return self.run_test("Get Invalid Checkout Status", "GET", "checkout/status/invalid_session_id", 404)
+        return await self.run_test("Get Invalid Checkout Status", "GET", "checkout/status/invalid_session_id", 404)
 
-    def test_invalid_endpoints(self):
+    async def test_invalid_endpoints(self):
         """Test error handling for invalid endpoints"""
-        print("\n🔍 Testing Error Handling...")
-        
-        # Test invalid state
-        self.run_test("Invalid State", "GET", "states/invalid_state", 404)
+        log.info("\n🔍 Testing Error Handling...")
         
-        # Test invalid product ID
-        self.run_test("Invalid Product ID", "GET", "products/invalid_id", 404)
-        
-        # Test adding invalid product to cart
         invalid_cart_data = {
             "product_id": "invalid_id",
             "quantity": 1,
             "user_session": self.session_id
         }
-        self.run_test("Add Invalid Product to Cart", "POST", "cart/add", 404, data=invalid_cart_data)
+        # Invalid state, invalid product ID and adding an invalid product to the
+        # cart are independent probes, so issue them concurrently
+        await asyncio.gather(
+            self.run_test("Invalid State", "GET", "states/invalid_state", 404),
+            self.run_test("Invalid Product ID", "GET", "products/invalid_id", 404),
+            self.run_test("Add Invalid Product to Cart", "POST", "cart/add", 404, data=invalid_cart_data),
+        )
 
-def main():
-    print("🚀 Starting AgriMap Market API Tests")
-    print("=" * 50)
-    
-    tester = AgriMapAPITester()
+async def main():
+    log.info("🚀 Starting AgriMap Market API Tests")
+    log.info("=" * 50)
     
-    # Test sequence
-    test_sequence = [
-        ("Root Endpoint", tester.test_root_endpoint),
-        ("States Data", tester.test_get_states),
-        ("Specific State", lambda: tester.test_get_specific_state("punjab")),
-        ("All Products", tester.test_get_all_products),
-        ("Punjab Products", lambda: tester.test_get_products_by_state("punjab")),
-        ("Kerala Products", lambda: tester.test_get_products_by_state("kerala")),
-        ("Specific Product", tester.test_get_specific_product),
-        ("Add to Cart", tester.test_add_to_cart),
-        ("Get Cart", tester.test_get_cart),
-        ("Update Cart", tester.test_update_cart_quantity),
-        ("Remove from Cart", tester.test_remove_from_cart),
-        ("Checkout Session", tester.test_checkout_create_session),
-        ("Invalid Checkout Status", tester.test_checkout_status_invalid),
-        ("Error Handling", tester.test_invalid_endpoints),
-    ]
-    
-    for test_name, test_func in test_sequence:
+    async with AgriMapAPITester() as tester:
+        # Read-only tests have no ordering dependency, so they run concurrently
+        independent = [
+            ("States Data", tester.test_get_states),
+            ("States ETag", tester.test_states_etag),
+            ("Specific State", lambda: tester.test_get_specific_state("punjab")),
+            ("All Products", tester.test_get_all_products),
+            ("Products by State", tester.test_all_states_products),
+            ("Products Pagination", tester.test_products_pagination),
+            ("Invalid Checkout Status", tester.test_checkout_status_invalid),
+            ("Error Handling", tester.test_invalid_endpoints),
+        ]
+        # These need the collected product IDs and share the cart session, so they run in order
+        dependent = [
+            ("Specific Product", tester.test_get_specific_product),
+            ("Cart Lifecycle", tester.test_cart_lifecycle),
+            ("Checkout Session", tester.test_checkout_create_session),
+        ]
+        
+        # The cheap root check goes first, on its own: it pays the DNS lookup and
+        # first TLS handshake once, before the concurrent fan-out opens more connections
         try:
-            test_func()
+            await tester.test_root_endpoint()
         except Exception as e:
-            print(f"❌ {test_name} failed with exception: {str(e)}")
+            log.warning(f"❌ Root Endpoint failed with exception: {str(e)}")
+        
+        results = await asyncio.gather(
+            *(test_func() for _, test_func in independent), return_exceptions=True
+        )
+        for (test_name, _), result in zip(independent, results):
+            if isinstance(result, Exception):
+                log.warning(f"❌ {test_name} failed with exception: {str(result)}")
+        
+        for test_name, test_func in dependent:
+            try:
+                await test_func()
+            except Exception as e:
+                log.warning(f"❌ {test_name} failed with exception: {str(e)}")
     
     # Print final results
-    print("\n" + "=" * 50)
-    print(f"📊 Test Results: {tester.tests_passed}/{tester.tests_run} tests passed")
+    log.info("\n" + "=" * 50)
+    log.info(f"📊 Test Results: {tester.tests_passed}/{tester.tests_run} tests passed")
     
     if tester.tests_passed == tester.tests_run:
-        print("🎉 All tests passed! Backend API is working correctly.")
+        log.info("🎉 All tests passed! Backend API is working correctly.")
         return 0
     else:
-        print(f"⚠️  {tester.tests_run - tester.tests_passed} tests failed. Please check the issues above.")
+        log.warning(f"⚠️  {tester.tests_run - tester.tests_passed} tests failed. Please check the issues above.")
         return 1
 
 if __name__ == "__main__":
-    sys.exit(main())
\ No newline at end of file
+    # TEST_LOG=WARNING keeps only failures and warnings, e.g. in CI
+    logging.basicConfig(level=os.environ.get('TEST_LOG', 'INFO'), format='%(message)s', stream=sys.stdout)
+    sys.exit(asyncio.run(main()))
\ No newline at end of file